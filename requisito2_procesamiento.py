@@ -7,19 +7,25 @@ Este script procesa discursos históricos, genera embeddings semánticos
 y los almacena en MongoDB configurado con Replica Set.
 """
 
+import argparse
 import os
 import sys
+import queue
+import threading
 import hashlib
 import json
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import logging
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
-from pymongo import MongoClient, WriteConcern, errors
+from bson.binary import Binary
+from pymongo import MongoClient, UpdateOne, WriteConcern, errors
+from pymongo.read_concern import ReadConcern
 from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
 from tqdm import tqdm
 
@@ -33,6 +39,60 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Espacios que elimina bytes.strip()
+ASCII_WHITESPACE = frozenset(b' \t\n\r\x0b\x0c')
+
+
+def decode_embedding(data: bytes) -> np.ndarray:
+    """
+    Decodifica el campo 'embedding' de un documento almacenado por este script.
+    
+    Args:
+        data: Valor BinData del campo 'embedding' (float32 little-endian)
+        
+    Returns:
+        Vector numpy float32 de dimensión 384 (solo lectura, sin copia)
+    """
+    return np.frombuffer(data, dtype='<f4')
+
+
+def quantize_embeddings(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cuantiza cada fila a int8 con una transformación afín propia de la fila
+    (x ≈ q * scale + zero_point), usando su mínimo y máximo.
+    
+    Args:
+        embeddings: Matriz float32 de forma (n, dimensión)
+        
+    Returns:
+        Tupla (q int8 de forma (n, dimensión), scale (n,), zero_point (n,))
+    """
+    mins = embeddings.min(axis=1)
+    maxs = embeddings.max(axis=1)
+    scale = (maxs - mins) / 255.0
+    scale[scale == 0] = 1.0
+    zero_point = mins + 128.0 * scale
+    
+    q = np.rint((embeddings - zero_point[:, None]) / scale[:, None])
+    q = np.clip(q, -128, 127).astype(np.int8)
+    
+    return q, scale.astype(np.float32), zero_point.astype(np.float32)
+
+
+def dequantize_embedding(data: bytes, scale: float, zero_point: float) -> np.ndarray:
+    """
+    Reconstruye el vector float32 de un documento almacenado con --int8-embeddings.
+    
+    Args:
+        data: Valor BinData del campo 'embedding_q' (int8)
+        scale: Campo 'scale' del documento
+        zero_point: Campo 'zero_point' del documento
+        
+    Returns:
+        Vector numpy float32 de dimensión 384
+    """
+    return np.frombuffer(data, dtype=np.int8).astype(np.float32) * scale + zero_point
+
 
 class CorpusProcessor:
     """
@@ -40,18 +100,42 @@ class CorpusProcessor:
     Diseñado para trabajar con el Replica Set configurado en el Requisito 1.
     """
     
-    def __init__(self, corpus_path: str):
+    def __init__(self, corpus_path: str, write_concern: Optional[WriteConcern] = None, batch_size: Optional[int] = None,
+                 compile_model: bool = False, use_bettertransformer: bool = False,
+                 int8_embeddings: bool = False, encode_processes: int = 0):
         """
         Inicializa el procesador con la ruta del corpus.
         
         Args:
             corpus_path: Ruta a la carpeta con los archivos .txt
+            write_concern: Write concern de cada insert_many durante la carga masiva.
+                           Por defecto w=1; si no es "majority", al terminar la carga
+                           se espera una única confirmación de la mayoría
+            batch_size: Tamaño de mini-batch del modelo de embeddings. Por defecto
+                        256 en GPU CUDA (FP16) y 64 en CPU/MPS
+            compile_model: Si es True, compila el modelo con torch.compile
+            use_bettertransformer: Si es True, usa los kernels fusionados de
+                                   BetterTransformer (requiere el paquete optimum)
+            int8_embeddings: Si es True, almacena los embeddings cuantizados a int8
+                             (campos embedding_q, scale y zero_point) en lugar de float32
+            encode_processes: Número de procesos de vectorización (0 = en el propio proceso).
+                              En CPU cada proceso usa una parte de los núcleos; en CUDA
+                              los procesos se reparten entre las GPUs disponibles. Con MPS
+                              se ignora y se vectoriza en un solo proceso en la GPU
         """
         self.corpus_path = Path(corpus_path)
+        self.write_concern = write_concern or WriteConcern(w=1)
+        self.compile_model = compile_model
+        self.use_bettertransformer = use_bettertransformer
+        self.int8_embeddings = int8_embeddings
+        self.encode_processes = encode_processes
+        self.pool = None
         self.client = None
         self.db = None
         self.collection = None
         self.model = None
+        self.device = None
+        self._rs_status = None
         
         self.stats = {
             'procesados': 0,
@@ -65,6 +149,14 @@ class CorpusProcessor:
         self.REPLICA_SET = "rs"
         self.DATABASE_NAME = "Política"  
         self.COLLECTION_NAME = "Discursos"
+        self.EMBEDDING_DIM = 384
+        self.EMBEDDING_FIELD = "embedding_q" if int8_embeddings else "embedding"
+        self.EMBEDDING_VALUE_BYTES = 1 if int8_embeddings else 4
+        self.MAX_MODEL_CHARS = 2048  # cota holgada para 256 wordpieces (~8 caracteres por token)
+        self.BATCH_SIZE = batch_size
+        self.PIPELINE_BATCH_SIZE = 256  # ventana de ordenamiento por longitud de cada encode()
+        self.QUEUE_SIZE = 4
+        self.READ_WORKERS = os.cpu_count() or 8
         
         self._initialize_components()
     
@@ -72,10 +164,28 @@ class CorpusProcessor:
         """Inicializa modelo de embeddings y conexión a MongoDB"""
         logger.info("🤖 Cargando modelo de embeddings...")
         try:
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.device = self._select_device()
+            self._configure_threads()
+            if self.BATCH_SIZE is None:
+                self.BATCH_SIZE = 256 if self.device == 'cuda' else 64
+            # En GPU los pesos se cargan directamente en FP16
+            model_kwargs = {"torch_dtype": torch.float16} if self.device == 'cuda' else None
+            self.model = SentenceTransformer('all-MiniLM-L6-v2', device=self.device, model_kwargs=model_kwargs)
+            bettertransformer = self.use_bettertransformer and self._apply_bettertransformer()
+            self._optimize_model_precision(quantize=not bettertransformer)
+            if self.encode_processes > 0 and self.device == 'mps':
+                # Los procesos del pool solo pueden usar CPU o CUDA: en Apple Silicon
+                # cambiarían la inferencia en GPU por varios procesos en CPU
+                logger.warning("⚠️  --encode-processes no se usa con MPS: se vectoriza en un solo proceso en la GPU")
+                self.encode_processes = 0
+            if self.encode_processes > 0:
+                self._start_encode_pool()
+            elif self.compile_model:
+                self._compile_model()
             logger.info("✅ Modelo cargado exitosamente")
             
             logger.info(f"   - Dimensión de embeddings: {self.model.get_sentence_embedding_dimension()}")
+            logger.info(f"   - Dispositivo: {self.device}")
             
         except Exception as e:
             logger.error(f"❌ Error cargando modelo: {e}")
@@ -83,6 +193,169 @@ class CorpusProcessor:
         
         self._connect_to_mongodb()
     
+    def _select_device(self) -> str:
+        """
+        Selecciona el dispositivo de inferencia disponible.
+        
+        Returns:
+            'cuda' si hay GPU NVIDIA, 'mps' en Apple Silicon, 'cpu' en otro caso
+        """
+        if torch.cuda.is_available():
+            return 'cuda'
+        
+        mps_backend = getattr(torch.backends, 'mps', None)
+        if mps_backend is not None and mps_backend.is_available():
+            return 'mps'
+        
+        return 'cpu'
+    
+    def _configure_threads(self):
+        """
+        Configura el paralelismo de PyTorch y del tokenizador para inferencia en CPU.
+        """
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+        
+        if self.device != 'cpu':
+            return
+        
+        torch.set_num_threads(os.cpu_count() or 1)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Solo puede fijarse antes de que PyTorch inicie trabajo paralelo
+            pass
+        
+        logger.info(f"   - Hilos de PyTorch: {torch.get_num_threads()}")
+    
+    def _apply_bettertransformer(self) -> bool:
+        """
+        Reemplaza las capas del encoder por las de BetterTransformer (atención
+        fusionada y nested tensors que omiten el padding).
+        
+        Returns:
+            True si se aplicó la transformación
+        """
+        try:
+            from optimum.bettertransformer import BetterTransformer
+        except ImportError:
+            logger.warning("⚠️  BetterTransformer requiere el paquete 'optimum' (pip install optimum); se usa el backend estándar")
+            return False
+        
+        transformer = self.model._first_module()
+        try:
+            transformer.auto_model = BetterTransformer.transform(transformer.auto_model)
+            logger.info("   - Backend: BetterTransformer")
+            return True
+            
+        except Exception as e:
+            logger.warning(f"⚠️  No se pudo aplicar BetterTransformer, se usa el backend estándar: {e}")
+            return False
+    
+    def _optimize_model_precision(self, quantize: bool = True):
+        """
+        Reduce la precisión del modelo según el dispositivo:
+        FP16 en GPU (tensor cores, pesos ya cargados en FP16) y cuantización
+        dinámica int8 de las capas lineales en CPU.
+        
+        Args:
+            quantize: Si es False no se cuantiza en CPU (las capas de
+                      BetterTransformer no son nn.Linear)
+        """
+        if self.device == 'cuda':
+            logger.info("   - Precisión: FP16")
+            
+        elif self.device == 'cpu' and quantize:
+            transformer = self.model._first_module()
+            transformer.auto_model = torch.quantization.quantize_dynamic(
+                transformer.auto_model,
+                {torch.nn.Linear},
+                dtype=torch.qint8
+            )
+            logger.info("   - Precisión: int8 (cuantización dinámica)")
+            
+        else:
+            logger.info("   - Precisión: FP32")
+    
+    def _compile_model(self):
+        """
+        Compila el transformer con torch.compile y lo precalienta.
+        Se usa mode="default" también en GPU: "reduce-overhead" graba un CUDA graph
+        por cada forma (lote, longitud) distinta, y los lotes del corpus tienen
+        longitudes variables. Si la compilación falla, se continúa con el modelo
+        sin compilar.
+        """
+        transformer = self.model._first_module()
+        eager_model = transformer.auto_model
+        
+        try:
+            transformer.auto_model = torch.compile(eager_model)
+            
+            # torch.compile es perezoso: la compilación ocurre en la primera llamada.
+            # Dos lotes de forma distinta hacen que la recompilación con dimensiones
+            # dinámicas ocurra aquí y no durante la carga
+            warmup_batches = [
+                ["calentamiento"] * self.BATCH_SIZE,
+                ["calentamiento " * 64] * max(1, self.BATCH_SIZE // 2)
+            ]
+            for textos in warmup_batches:
+                self.model.encode(
+                    textos,
+                    batch_size=self.BATCH_SIZE,
+                    device=self.device,
+                    show_progress_bar=False
+                )
+            logger.info("   - Modelo compilado con torch.compile")
+            
+        except Exception as e:
+            transformer.auto_model = eager_model
+            logger.warning(f"⚠️  No se pudo compilar el modelo, se usa modo eager: {e}")
+    
+    def _start_encode_pool(self):
+        """
+        Arranca un proceso de vectorización por cada dispositivo de destino
+        (start_multi_process_pool), esquivando el GIL en la inferencia. Cada
+        proceso recibe una copia del modelo ya cargado; torch.compile no se
+        aplica porque el modelo compilado no puede enviarse a otro proceso.
+        Si el pool no arranca, se vectoriza en el propio proceso. Solo se usa
+        con CPU o CUDA; con MPS _initialize_components no lo arranca.
+        """
+        if self.compile_model:
+            logger.warning("⚠️  --compile se ignora al vectorizar con varios procesos")
+        
+        # Variables que heredan los procesos hijos al arrancar: con N procesos
+        # tokenizando a la vez, el tokenizador no debe usar además todos los núcleos
+        worker_env = {"TOKENIZERS_PARALLELISM": "false"}
+        
+        if self.device == 'cuda':
+            gpus = torch.cuda.device_count()
+            target_devices = [f"cuda:{i % gpus}" for i in range(self.encode_processes)]
+        else:
+            target_devices = ['cpu'] * self.encode_processes
+            # Torch lee la variable al importarse en cada hijo: se reparten los
+            # núcleos en lugar de que cada uno use todos (salvo que el usuario la fije)
+            if "OMP_NUM_THREADS" not in os.environ:
+                threads = max(1, (os.cpu_count() or 1) // self.encode_processes)
+                worker_env["OMP_NUM_THREADS"] = str(threads)
+        
+        # El entorno del proceso principal se restaura una vez arrancados los hijos
+        saved_env = {name: os.environ.get(name) for name in worker_env}
+        os.environ.update(worker_env)
+        
+        try:
+            self.pool = self.model.start_multi_process_pool(target_devices=target_devices)
+            logger.info(f"   - Vectorización en {len(target_devices)} procesos: {', '.join(target_devices)}")
+            
+        except Exception as e:
+            self.pool = None
+            logger.warning(f"⚠️  No se pudo iniciar el pool de procesos, se vectoriza en un solo proceso: {e}")
+            
+        finally:
+            for name, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+    
     def _connect_to_mongodb(self):
         """
         Establece conexión con MongoDB Replica Set.
@@ -135,7 +408,7 @@ class CorpusProcessor:
             logger.info(f"   - Versión: {server_info.get('version', 'desconocida')}")
             
             if self.client.admin.command('isMaster').get('setName'):
-                status = self.client.admin.command('replSetGetStatus')
+                status = self._get_rs_status()
                 logger.info(f"   - Replica Set: {status['set']}")
                 logger.info(f"   - Miembros activos: {len(status['members'])}")
                 
@@ -147,76 +420,151 @@ class CorpusProcessor:
         except Exception as e:
             logger.warning(f"⚠️  No se pudo obtener información completa del servidor: {e}")
     
-    def generate_sha256(self, text: str) -> str:
+    def _get_rs_status(self) -> Dict:
+        """
+        Retorna el estado del Replica Set, consultándolo al servidor solo la primera vez.
+        
+        Returns:
+            Resultado del comando replSetGetStatus
+        """
+        if self._rs_status is None:
+            self._rs_status = self.client.admin.command('replSetGetStatus')
+        return self._rs_status
+    
+    def generate_sha256(self, text: Union[str, bytes, memoryview]) -> str:
         """
         Genera hash SHA-256 del texto.
         
         Args:
-            text: Texto a hashear
+            text: Texto a hashear, o su codificación UTF-8 si ya está disponible
+                  (se hashea en una sola llamada sin volver a codificar)
             
         Returns:
             Hash hexadecimal de 64 caracteres
         """
-        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+        data = text.encode('utf-8') if isinstance(text, str) else text
+        return hashlib.sha256(data).hexdigest()
     
-    def generate_embedding(self, text: str) -> List[float]:
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """
-        Genera embedding del texto usando sentence-transformers.
+        Genera los embeddings de un lote de textos usando sentence-transformers.
         
         Args:
-            text: Texto a vectorizar
+            texts: Lista de textos a vectorizar
             
         Returns:
-            Lista de floats representando el embedding
+            Matriz numpy contigua float32 de forma (len(texts), dimensión del embedding),
+            con cada fila normalizada (norma L2 = 1)
         """
+        # El modelo trunca a max_seq_length (256) wordpieces: no tiene sentido
+        # tokenizar discursos completos. Se guarda el texto íntegro en MongoDB.
+        texts_for_model = [texto[:self.MAX_MODEL_CHARS] for texto in texts]
+        
         try:
-            embedding = self.model.encode(text, show_progress_bar=False)
+            if self.pool is not None:
+                # Un fragmento del lote por proceso
+                chunk_size = -(-len(texts_for_model) // len(self.pool['processes']))
+                embeddings = self.model.encode_multi_process(
+                    texts_for_model,
+                    self.pool,
+                    batch_size=self.BATCH_SIZE,
+                    chunk_size=chunk_size,
+                    normalize_embeddings=True
+                )
+            else:
+                # Con convert_to_tensor el modelo apila el lote en un solo tensor en el
+                # dispositivo; convert_to_numpy convertiría cada fila por separado y
+                # luego las copiaría a una matriz nueva
+                embeddings = self.model.encode(
+                    texts_for_model,
+                    batch_size=self.BATCH_SIZE,
+                    device=self.device,
+                    convert_to_tensor=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False
+                ).float().cpu().numpy()
+            
+            if embeddings.ndim != 2 or embeddings.shape[1] != self.EMBEDDING_DIM:
+                raise ValueError(f"Dimensión de embedding inesperada: {embeddings.shape} "
+                                 f"(se esperaba (n, {self.EMBEDDING_DIM}))")
             
-            return embedding.tolist()
+            # Una sola matriz contigua float32 little-endian para todo el lote
+            # (en GPU el modelo corre en FP16): cada fila se serializa sin conversiones
+            return np.ascontiguousarray(embeddings, dtype='<f4')
             
         except Exception as e:
-            logger.error(f"Error generando embedding: {e}")
+            logger.error(f"Error generando embeddings: {e}")
             raise
     
-    def process_file(self, filepath: Path) -> Optional[Dict]:
+    def _read_text(self, filepath: Path) -> Tuple[str, Union[bytes, memoryview]]:
         """
-        Procesa un archivo individual y retorna el documento MongoDB.
+        Lee el contenido de un archivo con una sola lectura de disco sobre un
+        buffer reservado de antemano; los espacios de los extremos se descartan
+        con una vista del buffer, sin copiar el contenido como haría bytes.strip().
+        Intenta UTF-8 y, si falla, decodifica como latin-1 (que acepta
+        cualquier secuencia de bytes, igual que la antigua cascada de encodings).
         
         Args:
             filepath: Ruta al archivo .txt
             
         Returns:
-            Diccionario con la estructura del documento o None si hay error
+            Tupla (texto, bytes UTF-8 del texto). En el caso común (archivo UTF-8
+            sin retornos de carro) es una vista de los bytes leídos del disco, sin recodificar
         """
+        with open(filepath, 'rb') as f:
+            buf = bytearray(os.fstat(f.fileno()).st_size)
+            size = f.readinto(buf)
+        
+        start, end = 0, size
+        while start < end and buf[start] in ASCII_WHITESPACE:
+            start += 1
+        while end > start and buf[end - 1] in ASCII_WHITESPACE:
+            end -= 1
+        raw = memoryview(buf)[start:end]
+        
+        # No se usa detección de charset (chardet/charset-normalizer): analizar los
+        # bytes es más caro que decodificar latin-1, y cambiaría el texto, y con él
+        # el _id, de los documentos no UTF-8 ya cargados
         try:
-            texto = None
-            encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252']
-            
-            for encoding in encodings:
-                try:
-                    with open(filepath, 'r', encoding=encoding) as f:
-                        texto = f.read().strip()
-                    break
-                except UnicodeDecodeError:
-                    continue
+            texto = str(raw, 'utf-8')
+            is_utf8 = True
+        except UnicodeDecodeError:
+            texto = str(raw, 'latin-1')
+            is_utf8 = False
+        
+        # Misma normalización de saltos de línea que open() en modo texto
+        if '\r' in texto:
+            texto = texto.replace('\r\n', '\n').replace('\r', '\n')
+            is_utf8 = False
+        
+        # bytes.strip() solo quita espacios ASCII; str.strip() quita además
+        # espacios Unicode, que pueden quedar en los extremos
+        stripped = texto.strip()
+        if is_utf8 and len(stripped) == len(texto):
+            return texto, raw
+        
+        return stripped, stripped.encode('utf-8')
+    
+    def process_file(self, filepath: Path) -> Optional[Tuple[str, str]]:
+        """
+        Lee un archivo individual y calcula su identificador.
+        Se ejecuta en los hilos del pool de lectura.
+        
+        Args:
+            filepath: Ruta al archivo .txt
             
-            if texto is None:
-                raise ValueError(f"No se pudo leer el archivo con ningún encoding")
+        Returns:
+            Tupla (doc_id, texto) o None si hay error
+        """
+        try:
+            texto, data = self._read_text(filepath)
             
             if not texto:
                 raise ValueError("Archivo vacío")
             
-            doc_id = self.generate_sha256(texto)
-            
-            embedding = self.generate_embedding(texto)
+            doc_id = self.generate_sha256(data)
             
-            documento = {
-                "_id": doc_id,
-                "texto": texto,
-                "embedding": embedding
-            }
-            
-            return documento
+            return doc_id, texto
             
         except Exception as e:
             logger.error(f"Error procesando {filepath.name}: {str(e)}")
@@ -235,54 +583,362 @@ class CorpusProcessor:
         logger.info("🚀 INICIANDO PROCESAMIENTO DEL CORPUS")
         logger.info("="*60)
         
-        txt_files = list(self.corpus_path.glob('*.txt'))
-        total_files = len(txt_files)
+        # scandir obtiene el tipo de cada entrada (is_file) de la propia lectura del
+        # directorio, sin el filtrado por patrón de glob; el tamaño para ordenar sí
+        # requiere una llamada a stat() por archivo en Linux/macOS
+        with os.scandir(self.corpus_path) as entries:
+            txt_entries = [
+                entry for entry in entries
+                if entry.name.endswith('.txt') and entry.is_file()
+            ]
+        total_files = len(txt_entries)
         
         if total_files == 0:
             logger.error(f"❌ No se encontraron archivos .txt en {self.corpus_path}")
             return
         
+        # Lotes de textos de longitud similar: menos padding en cada mini-batch del modelo
+        txt_entries.sort(key=lambda entry: entry.stat().st_size)
+        txt_files = [Path(entry.path) for entry in txt_entries]
+        
         logger.info(f"📁 Encontrados {total_files} archivos para procesar")
         logger.info(f"📍 Carpeta: {self.corpus_path.absolute()}")
         
-        with tqdm(total=total_files, desc="Procesando discursos", unit="archivo") as pbar:
-            for idx, filepath in enumerate(txt_files):
-                try:
-                    documento = self.process_file(filepath)
-                    
-                    if documento is None:
-                        self.stats['errores'] += 1
-                        pbar.update(1)
-                        continue
-                    
-                    result = self.collection.with_options(write_concern=WriteConcern(w="majority", wtimeout=5000)).insert_one(documento)
+        if self.write_concern.document.get('w') != "majority":
+            logger.info(f"✍️  Carga con write concern {self.write_concern.document}; "
+                        "la replicación en la mayoría se confirma al final")
+        
+        # Los índices secundarios se eliminan en la etapa de escritura antes del
+        # primer lote con documentos nuevos; se reconstruyen aunque la carga falle
+        try:
+            read_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+            write_queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+            progress_queue = queue.Queue()
+            stage_errors = []
+            
+            stages = [
+                threading.Thread(target=self._reader_stage, args=(txt_files, read_queue, stage_errors), name="lector", daemon=True),
+                threading.Thread(target=self._encoder_stage, args=(read_queue, write_queue, stage_errors), name="vectorizador", daemon=True),
+                threading.Thread(target=self._writer_stage, args=(write_queue, progress_queue, stage_errors), name="escritor", daemon=True)
+            ]
+            
+            for stage in stages:
+                stage.start()
+            
+            with tqdm(total=total_files, desc="Procesando discursos", unit="archivo") as pbar:
+                while True:
+                    completados = progress_queue.get()
+                    if completados is None:
+                        break
                     
-                    self.stats['procesados'] += 1
-
+                    pbar.update(completados)
                     pbar.set_postfix({
                         'Procesados': self.stats['procesados'],
                         'Errores': self.stats['errores'],
                         'Duplicados': self.stats['duplicados']
                     })
+            
+            for stage in stages:
+                stage.join()
+            
+            if stage_errors:
+                raise stage_errors[0]
+            
+            if self.write_concern.document.get('w') != "majority":
+                self._wait_for_majority()
+            
+        finally:
+            self.create_indexes()
+        
+        self._print_summary()
+    
+    def _wait_for_majority(self):
+        """
+        Barrera de durabilidad tras una carga con w=1: una escritura nula con
+        w="majority" espera a que la mayoría replique la última entrada del oplog,
+        y con ella todas las inserciones anteriores.
+        
+        Raises:
+            PyMongoError: Si la mayoría no confirma la carga; es la única
+                          confirmación de durabilidad, así que la ejecución falla
+        """
+        logger.info("⏳ Esperando confirmación de la mayoría del Replica Set...")
+        
+        try:
+            self.collection.with_options(
+                write_concern=WriteConcern(w="majority", wtimeout=60000)
+            ).delete_one({"_id": {"$exists": False}})
+            logger.info("✅ Carga replicada en la mayoría de los nodos")
+            
+        except errors.PyMongoError as e:
+            logger.error(f"❌ La mayoría del Replica Set no confirmó la carga: {e}")
+            raise
+    
+    def _reader_stage(self, txt_files: List[Path], out_queue: queue.Queue, stage_errors: List[Exception]):
+        """
+        Etapa 1 del pipeline: lee y hashea los archivos en lotes usando un pool de hilos.
+        
+        Args:
+            txt_files: Archivos del corpus
+            out_queue: Cola hacia la etapa de vectorización
+            stage_errors: Lista compartida donde se registran errores inesperados
+        """
+        try:
+            chunks = [
+                txt_files[start:start + self.PIPELINE_BATCH_SIZE]
+                for start in range(0, len(txt_files), self.PIPELINE_BATCH_SIZE)
+            ]
+            
+            seen_ids = set()
+            
+            with ThreadPoolExecutor(max_workers=self.READ_WORKERS) as executor:
+                # La lectura del lote siguiente se solapa con la espera en la cola
+                next_results = executor.map(self.process_file, chunks[0])
+                
+                for chunk_idx, chunk in enumerate(chunks):
+                    batch = {
+                        'ids': [],
+                        'texts': [],
+                        'filenames': [],
+                        'archivos': len(chunk),
+                        'errores': 0,
+                        'duplicados': 0
+                    }
                     
-                except errors.DuplicateKeyError:
-                    logger.warning(f"⚠️  Documento duplicado: {filepath.name}")
-                    self.stats['duplicados'] += 1
+                    for filepath, resultado in zip(chunk, next_results):
+                        if resultado is None:
+                            batch['errores'] += 1
+                            continue
+                        
+                        doc_id, texto = resultado
+                        batch['ids'].append(doc_id)
+                        batch['texts'].append(texto)
+                        batch['filenames'].append(filepath.name)
                     
-                except Exception as e:
-                    logger.error(f"❌ Error con {filepath.name}: {str(e)}")
-                    self.stats['errores'] += 1
-                    self.stats['archivos_error'].append({
-                        'archivo': filepath.name,
-                        'error': str(e)
-                    })
+                    if chunk_idx + 1 < len(chunks):
+                        next_results = executor.map(self.process_file, chunks[chunk_idx + 1])
+                    
+                    self._skip_existing(batch, seen_ids)
+                    out_queue.put(batch)
+                    
+        except Exception as e:
+            logger.error(f"❌ Error en la etapa de lectura: {e}")
+            stage_errors.append(e)
+            
+        finally:
+            out_queue.put(None)
+    
+    def _skip_existing(self, batch: Dict, seen_ids: set):
+        """
+        Descarta del lote, antes de gastar inferencia en ellos, los documentos
+        repetidos dentro del propio corpus y los cuyo _id ya existe en la colección.
+        
+        Args:
+            batch: Lote producido por la etapa de lectura (se modifica in situ)
+            seen_ids: Identificadores ya vistos en esta ejecución (se actualiza)
+        """
+        if not batch['ids']:
+            return
+        
+        keep = []
+        for i, doc_id in enumerate(batch['ids']):
+            if doc_id in seen_ids:
+                logger.warning(f"⚠️  Documento duplicado: {batch['filenames'][i]}")
+            else:
+                seen_ids.add(doc_id)
+                keep.append(i)
+        
+        candidate_ids = [batch['ids'][i] for i in keep]
+        existing = set(
+            doc['_id'] for doc in self.collection.find({"_id": {"$in": candidate_ids}}, {"_id": 1})
+        ) if candidate_ids else set()
+        
+        if existing:
+            logger.debug(f"   {len(existing)} documentos ya existentes omitidos antes de vectorizar")
+            keep = [i for i in keep if batch['ids'][i] not in existing]
+        
+        if len(keep) == len(batch['ids']):
+            return
+        
+        batch['duplicados'] += len(batch['ids']) - len(keep)
+        batch['ids'] = [batch['ids'][i] for i in keep]
+        batch['texts'] = [batch['texts'][i] for i in keep]
+        batch['filenames'] = [batch['filenames'][i] for i in keep]
+    
+    def _encoder_stage(self, in_queue: queue.Queue, out_queue: queue.Queue, stage_errors: List[Exception]):
+        """
+        Etapa 2 del pipeline: genera los embeddings de cada lote.
+        Si un lote falla, sus archivos se contabilizan como errores y se continúa.
+        
+        Args:
+            in_queue: Cola desde la etapa de lectura
+            out_queue: Cola hacia la etapa de escritura
+            stage_errors: Lista compartida donde se registran errores inesperados
+        """
+        try:
+            while True:
+                batch = in_queue.get()
+                if batch is None:
+                    break
+                
+                if batch['texts']:
+                    try:
+                        batch['embeddings'] = self.generate_embeddings(batch['texts'])
+                        
+                    except Exception as e:
+                        for filename in batch['filenames']:
+                            self.stats['archivos_error'].append({
+                                'archivo': filename,
+                                'error': str(e)
+                            })
+                        batch['errores'] += len(batch['texts'])
+                        batch['ids'] = []
+                        batch['texts'] = []
+                        batch['filenames'] = []
                 
-                pbar.update(1)
+                out_queue.put(batch)
                 
-                if (idx + 1) % 50 == 0:
-                    time.sleep(0.1)
+        except Exception as e:
+            logger.error(f"❌ Error en la etapa de vectorización: {e}")
+            stage_errors.append(e)
+            self._drain_queue(in_queue)
+            
+        finally:
+            out_queue.put(None)
+    
+    def _writer_stage(self, in_queue: queue.Queue, progress_queue: queue.Queue, stage_errors: List[Exception]):
+        """
+        Etapa 3 del pipeline: inserta cada lote en MongoDB y reporta el avance.
+        Es la única etapa que actualiza los contadores de self.stats.
         
-        self._print_summary()
+        Args:
+            in_queue: Cola desde la etapa de vectorización
+            progress_queue: Cola con el número de archivos completados por lote
+            stage_errors: Lista compartida donde se registran errores inesperados
+        """
+        indexes_dropped = False
+        
+        try:
+            while True:
+                batch = in_queue.get()
+                if batch is None:
+                    break
+                
+                self.stats['errores'] += batch['errores']
+                self.stats['duplicados'] += batch['duplicados']
+                
+                if batch['texts']:
+                    if not indexes_dropped:
+                        self._drop_secondary_indexes()
+                        indexes_dropped = True
+                    documentos = self._build_documents(batch['ids'], batch['texts'], batch['embeddings'])
+                    self._insert_batch(documentos, batch['filenames'])
+                
+                progress_queue.put(batch['archivos'])
+                
+        except Exception as e:
+            logger.error(f"❌ Error en la etapa de escritura: {e}")
+            stage_errors.append(e)
+            self._drain_queue(in_queue)
+            
+        finally:
+            progress_queue.put(None)
+    
+    def _build_documents(self, ids: List[str], texts: List[str], embeddings: np.ndarray) -> List[Dict]:
+        """
+        Construye los documentos MongoDB de un lote (float32 o int8 según la configuración).
+        Cada embedding es un slice de un único memoryview sobre la matriz del lote,
+        de modo que los bytes se copian una sola vez, directamente al Binary.
+        
+        Args:
+            ids: Identificadores SHA-256
+            texts: Textos completos
+            embeddings: Matriz contigua float32 de forma (len(ids), EMBEDDING_DIM)
+            
+        Returns:
+            Lista de documentos listos para insert_many
+        """
+        if self.int8_embeddings:
+            q, scale, zero_point = quantize_embeddings(embeddings)
+            row_bytes = q.shape[1]
+            buffer = memoryview(q).cast('B')
+            
+            return [
+                {
+                    "_id": doc_id,
+                    "texto": texto,
+                    "embedding_q": Binary(buffer[i * row_bytes:(i + 1) * row_bytes], subtype=0),
+                    "scale": float(scale[i]),
+                    "zero_point": float(zero_point[i]),
+                    "dim": self.EMBEDDING_DIM
+                }
+                for i, (doc_id, texto) in enumerate(zip(ids, texts))
+            ]
+        
+        row_bytes = embeddings.shape[1] * embeddings.itemsize
+        buffer = memoryview(embeddings).cast('B')
+        
+        return [
+            {
+                "_id": doc_id,
+                "texto": texto,
+                "embedding": Binary(buffer[i * row_bytes:(i + 1) * row_bytes], subtype=0),
+                "dim": self.EMBEDDING_DIM
+            }
+            for i, (doc_id, texto) in enumerate(zip(ids, texts))
+        ]
+    
+    def _drain_queue(self, q: queue.Queue):
+        """Descarta los lotes pendientes hasta el centinela para no bloquear a la etapa anterior"""
+        while q.get() is not None:
+            pass
+    
+    def _insert_batch(self, documentos: List[Dict], filenames: List[str]):
+        """
+        Inserta un lote de documentos con insert_many y actualiza las estadísticas.
+        
+        Args:
+            documentos: Documentos a insertar
+            filenames: Nombre del archivo de origen de cada documento (mismo orden)
+        """
+        collection = self.collection.with_options(write_concern=self.write_concern)
+        
+        try:
+            result = collection.insert_many(documentos, ordered=False)
+            self.stats['procesados'] += len(result.inserted_ids)
+            
+        except errors.BulkWriteError as bwe:
+            write_errors = bwe.details.get('writeErrors', [])
+            self.stats['procesados'] += bwe.details.get('nInserted', 0)
+            
+            for write_error in write_errors:
+                filename = filenames[write_error['index']]
+                
+                if write_error.get('code') == 11000:
+                    logger.warning(f"⚠️  Documento duplicado: {filename}")
+                    self.stats['duplicados'] += 1
+                else:
+                    logger.error(f"❌ Error con {filename}: {write_error.get('errmsg')}")
+                    self.stats['errores'] += 1
+                    self.stats['archivos_error'].append({
+                        'archivo': filename,
+                        'error': write_error.get('errmsg')
+                    })
+            
+            # Los documentos se insertaron en el primario, pero no se confirmó la
+            # replicación dentro de wtimeout
+            for wc_error in bwe.details.get('writeConcernErrors', []):
+                logger.warning(f"⚠️  Write concern no satisfecho en un lote de {len(documentos)} documentos: "
+                               f"{wc_error.get('errmsg')}")
+            
+        except Exception as e:
+            logger.error(f"❌ Error insertando lote de {len(documentos)} documentos: {str(e)}")
+            self.stats['errores'] += len(documentos)
+            for filename in filenames:
+                self.stats['archivos_error'].append({
+                    'archivo': filename,
+                    'error': str(e)
+                })
     
     def _print_summary(self):
         """Imprime resumen detallado del procesamiento"""
@@ -296,7 +952,7 @@ class CorpusProcessor:
         print(f"❌ Errores durante el procesamiento: {self.stats['errores']}")
         print(f"⏱️  Tiempo total de procesamiento: {duracion:.2f} segundos")
         print(f"⚡ Velocidad promedio: {self.stats['procesados']/duracion:.2f} docs/segundo")
-        print(f"📦 Total documentos en la colección: {self.collection.count_documents({})}")
+        print(f"📦 Total documentos en la colección: {self.collection.estimated_document_count()}")
         print("="*60)
         
         if self.stats['archivos_error']:
@@ -307,65 +963,77 @@ class CorpusProcessor:
             if len(self.stats['archivos_error']) > 5:
                 print(f"   ... y {len(self.stats['archivos_error']) - 5} errores más")
     
-    def validate_collection(self):
+    def validate_collection(self, deep: bool = False):
         """
         Valida la integridad de la colección después del procesamiento.
         Verifica estructura, consistencia y replicación.
+        
+        Args:
+            deep: Si es True, recorre además toda la colección verificando el
+                  tamaño en bytes de cada embedding
         """
         logger.info("\n" + "="*60)
         logger.info("🔍 VALIDACIÓN DE LA COLECCIÓN")
         logger.info("="*60)
         
-        total_docs = self.collection.count_documents({})
+        # Solo se valida lo confirmado por la mayoría (relevante si la carga usó w=1)
+        collection = self.collection.with_options(read_concern=ReadConcern("majority"))
+        
+        total_docs = collection.estimated_document_count()
         logger.info(f"📊 Total de documentos en la colección: {total_docs}")
         
         if total_docs == 0:
             logger.warning("⚠️  La colección está vacía")
             return False
 
-        sample = self.collection.find_one()
+        sample = collection.find_one()
         if sample:
             logger.info("\n✅ Estructura del documento de muestra:")
             logger.info(f"   - ID (SHA-256): {sample['_id'][:32]}...")
             logger.info(f"   - Longitud del texto: {len(sample['texto'])} caracteres")
-            logger.info(f"   - Dimensión del embedding: {len(sample['embedding'])}")
+            if 'embedding_q' in sample:
+                vector = dequantize_embedding(sample['embedding_q'], sample['scale'], sample['zero_point'])
+                logger.info(f"   - Dimensión del embedding: {len(vector)} (int8)")
+            elif isinstance(sample.get('embedding'), (bytes, Binary)):
+                logger.info(f"   - Dimensión del embedding: {len(decode_embedding(sample['embedding']))} (float32)")
+            elif isinstance(sample.get('embedding'), list):
+                logger.info(f"   - Dimensión del embedding: {len(sample['embedding'])} (lista, formato anterior)")
             logger.info(f"   - Primeras palabras: {' '.join(sample['texto'].split()[:10])}...")
         
         logger.info("\n📐 Verificando consistencia de embeddings...")
-        pipeline = [
-            {"$project": {
-                "embedding_size": {"$size": "$embedding"}
-            }},
-            {"$group": {
-                "_id": "$embedding_size",
-                "count": {"$sum": 1}
-            }}
-        ]
-        
-        sizes = list(self.collection.aggregate(pipeline))
-        
-        if len(sizes) == 1 and sizes[0]['_id'] == 384:
-            logger.info(f"✅ Todos los {sizes[0]['count']} documentos tienen embeddings de 384 dimensiones")
+        # Consulta resuelta sobre el índice de 'dim', sin leer los embeddings
+        docs_otra_dim = collection.count_documents({"dim": {"$ne": self.EMBEDDING_DIM}})
+        if docs_otra_dim == 0:
+            logger.info(f"✅ Todos los documentos tienen embeddings de {self.EMBEDDING_DIM} dimensiones")
         else:
-            logger.warning("⚠️  Inconsistencia en las dimensiones de embeddings:")
-            for size in sizes:
-                logger.warning(f"   - {size['count']} documentos con {size['_id']} dimensiones")
+            logger.warning(f"⚠️  {docs_otra_dim} documentos con una dimensión distinta de {self.EMBEDDING_DIM} "
+                           "o sin campo 'dim'")
+        
+        if deep:
+            self._validate_embedding_sizes(collection)
         
         logger.info("\n🔎 Verificando campos requeridos...")
-        docs_sin_texto = self.collection.count_documents({"texto": {"$exists": False}})
-        docs_sin_embedding = self.collection.count_documents({"embedding": {"$exists": False}})
+        # Se acepta el embedding en cualquiera de los dos campos; los documentos en el
+        # formato no configurado se informan aparte
+        docs_incompletos = collection.count_documents({"$or": [
+            {"texto": {"$exists": False}},
+            {"embedding": {"$exists": False}, "embedding_q": {"$exists": False}}
+        ]})
         
-        if docs_sin_texto == 0 and docs_sin_embedding == 0:
+        if docs_incompletos == 0:
             logger.info("✅ Todos los documentos tienen los campos requeridos")
         else:
-            if docs_sin_texto > 0:
-                logger.warning(f"⚠️  {docs_sin_texto} documentos sin campo 'texto'")
-            if docs_sin_embedding > 0:
-                logger.warning(f"⚠️  {docs_sin_embedding} documentos sin campo 'embedding'")
+            logger.warning(f"⚠️  {docs_incompletos} documentos sin campo 'texto' o sin embedding")
+        
+        otro_campo = "embedding" if self.int8_embeddings else "embedding_q"
+        docs_otro_formato = collection.count_documents({otro_campo: {"$exists": True}})
+        if docs_otro_formato > 0:
+            logger.warning(f"⚠️  {docs_otro_formato} documentos con el embedding en '{otro_campo}' en lugar de "
+                           f"'{self.EMBEDDING_FIELD}'; se convierten al volver a ejecutar el script")
         
         logger.info("\n🔧 Verificando estado del Replica Set...")
         try:
-            status = self.client.admin.command('replSetGetStatus')
+            status = self._get_rs_status()
             logger.info(f"✅ Replica Set '{status['set']}' activo")
             logger.info(f"   - Miembros: {len(status['members'])}")
             
@@ -382,31 +1050,255 @@ class CorpusProcessor:
         
         return True
     
+    def _validate_embedding_sizes(self, collection):
+        """
+        Recorre toda la colección comprobando el tamaño de cada embedding.
+        Es una validación O(N) en el servidor, solo se usa con --deep-validate.
+        
+        Args:
+            collection: Colección sobre la que validar
+        """
+        expected_bytes = self.EMBEDDING_DIM * self.EMBEDDING_VALUE_BYTES
+        pipeline = [
+            {"$match": {self.EMBEDDING_FIELD: {"$type": "binData"}}},
+            {"$project": {
+                "embedding_size": {"$binarySize": f"${self.EMBEDDING_FIELD}"}
+            }},
+            {"$group": {
+                "_id": "$embedding_size",
+                "count": {"$sum": 1}
+            }}
+        ]
+        
+        sizes = list(collection.aggregate(pipeline))
+        
+        if len(sizes) == 1 and sizes[0]['_id'] == expected_bytes:
+            logger.info(f"✅ Todos los {sizes[0]['count']} documentos tienen embeddings de {self.EMBEDDING_DIM} dimensiones")
+        else:
+            logger.warning("⚠️  Inconsistencia en las dimensiones de embeddings:")
+            for size in sizes:
+                logger.warning(f"   - {size['count']} documentos con embeddings de {size['_id']} bytes (se esperan {expected_bytes})")
+        
+        docs_formato_antiguo = collection.count_documents({"embedding": {"$type": "array"}})
+        if docs_formato_antiguo > 0:
+            logger.warning(f"⚠️  {docs_formato_antiguo} documentos con el embedding como lista (formato anterior)")
+    
+    def migrate_legacy_embeddings(self) -> int:
+        """
+        Convierte al formato configurado los documentos cuyo embedding está en otro:
+        la lista de doubles de versiones anteriores del script, o la otra variante
+        BinData (float32 o int8) si --int8-embeddings cambió entre ejecuciones.
+        Como los _id no cambian y la carga omite los ya existentes, sin esta
+        conversión la colección mezclaría formatos. Es idempotente: solo toca
+        documentos que siguen en un formato distinto del configurado.
+        La conversión de int8 a float32 no recupera la precisión perdida al cuantizar.
+        
+        Returns:
+            Número de documentos convertidos
+        """
+        lista = ("lista", {"embedding": {"$type": "array"}},
+                 lambda doc: np.asarray(doc['embedding'], dtype=np.float32))
+        
+        if self.int8_embeddings:
+            origenes = [
+                lista,
+                ("float32", {"embedding": {"$type": "binData"}},
+                 lambda doc: decode_embedding(doc['embedding']))
+            ]
+            campos_otro_formato = {"embedding": ""}
+        else:
+            origenes = [
+                lista,
+                ("int8", {"embedding_q": {"$exists": True}},
+                 lambda doc: dequantize_embedding(doc['embedding_q'], doc['scale'], doc['zero_point']))
+            ]
+            campos_otro_formato = {"embedding_q": "", "scale": "", "zero_point": ""}
+        
+        # Se ejecuta fuera de la carga masiva: no la cubre la barrera final de w=1
+        collection = self.collection.with_options(write_concern=WriteConcern(w="majority", wtimeout=5000))
+        
+        return sum(
+            self._convert_embeddings(collection, formato, filtro, decode, campos_otro_formato)
+            for formato, filtro, decode in origenes
+        )
+    
+    def _convert_embeddings(self, collection, formato: str, filtro: Dict, decode, campos_otro_formato: Dict) -> int:
+        """
+        Reescribe en el formato configurado los documentos que cumplen el filtro.
+        
+        Args:
+            collection: Colección con write concern "majority"
+            formato: Nombre del formato de origen (para los mensajes)
+            filtro: Consulta que selecciona los documentos en el formato de origen
+            decode: Función que obtiene el vector float32 de un documento de origen
+            campos_otro_formato: Campos del formato no configurado que se eliminan
+            
+        Returns:
+            Número de documentos convertidos
+        """
+        if collection.count_documents(filtro, limit=1) == 0:
+            return 0
+        
+        formato_actual = "int8" if self.int8_embeddings else "float32"
+        logger.info(f"🔄 Convirtiendo embeddings en formato {formato} al formato {formato_actual}...")
+        
+        convertidos = 0
+        omitidos = 0
+        cursor = collection.find(filtro, {"texto": 0}, batch_size=self.PIPELINE_BATCH_SIZE)
+        
+        while True:
+            docs = [doc for _, doc in zip(range(self.PIPELINE_BATCH_SIZE), cursor)]
+            if not docs:
+                break
+            
+            vectores = [(doc['_id'], decode(doc)) for doc in docs]
+            validos = [(doc_id, vector) for doc_id, vector in vectores if len(vector) == self.EMBEDDING_DIM]
+            omitidos += len(docs) - len(validos)
+            if not validos:
+                continue
+            
+            embeddings = np.asarray([vector for _, vector in validos], dtype=np.float32)
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+            embeddings = np.ascontiguousarray(embeddings, dtype='<f4')
+            
+            nuevos = self._build_documents([doc_id for doc_id, _ in validos], [None] * len(validos), embeddings)
+            operaciones = [
+                UpdateOne(
+                    {"_id": nuevo['_id'], **filtro},
+                    {
+                        "$set": {k: v for k, v in nuevo.items() if k not in ('_id', 'texto')},
+                        "$unset": campos_otro_formato
+                    }
+                )
+                for nuevo in nuevos
+            ]
+            
+            result = collection.bulk_write(operaciones, ordered=False)
+            convertidos += result.modified_count
+        
+        logger.info(f"✅ {convertidos} documentos convertidos del formato {formato} al {formato_actual}")
+        if omitidos:
+            logger.warning(f"⚠️  {omitidos} documentos en formato {formato} con un embedding de dimensión "
+                           f"distinta de {self.EMBEDDING_DIM} no se convirtieron")
+        
+        return convertidos
+    
+    def _drop_secondary_indexes(self):
+        """
+        Elimina los índices secundarios antes del primer lote con documentos nuevos
+        para que las inserciones no los mantengan documento a documento. El índice
+        _id_ se conserva; process_corpus los reconstruye con create_indexes al
+        terminar la carga, también si falla o se interrumpe.
+        """
+        try:
+            self.collection.with_options(
+                write_concern=WriteConcern(w="majority", wtimeout=5000)
+            ).drop_indexes()
+            logger.info("🗑️  Índices secundarios eliminados hasta terminar la carga")
+            
+        except errors.OperationFailure as e:
+            # La colección todavía no existe: no hay índices que eliminar
+            logger.debug(f"No se eliminaron índices: {e}")
+    
     def create_indexes(self):
         """
         Crea índices adicionales para optimizar las búsquedas futuras.
+        Se ejecuta después de la carga masiva, construyendo cada índice de una vez;
+        si los índices ya existen, no hace nada.
         """
         logger.info("\n📇 Creando índices para optimización...")
         
+        collection = self.collection.with_options(write_concern=WriteConcern(w="majority", wtimeout=5000))
+        
         try:
-            self.collection.create_index([("texto", "text")], name="text_index")
+            collection.create_index([("texto", "text")], name="text_index")
             logger.info("✅ Índice de texto creado")
             
-            self.collection.create_index("embedding", name="embedding_index", sparse=True)
-            logger.info("✅ Índice de embedding creado")
+            collection.create_index("dim", name="dim_index")
+            logger.info("✅ Índice de dimensión creado")
+            
+            # No se indexa el embedding: un índice B-tree sobre el vector no sirve
+            # para búsqueda por similitud y solo encarece cada inserción
             
         except Exception as e:
             logger.warning(f"⚠️  Error creando índices: {e}")
     
     def close(self):
-        """Cierra la conexión a MongoDB"""
+        """Detiene el pool de vectorización, si existe, y cierra la conexión a MongoDB"""
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
+            logger.info("🛑 Procesos de vectorización detenidos")
+        
         if self.client:
             self.client.close()
             logger.info("🔌 Conexión a MongoDB cerrada")
 
 
+def positive_int(value: str) -> int:
+    """Tipo de argparse: entero mayor o igual que 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"debe ser un entero mayor o igual que 1: {value}")
+    return number
+
+
+def non_negative_int(value: str) -> int:
+    """Tipo de argparse: entero mayor o igual que 0"""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"debe ser un entero mayor o igual que 0: {value}")
+    return number
+
+
+def parse_args():
+    """Procesa los argumentos de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Requisito 2: Preprocesamiento y Vectorización del Corpus")
+    parser.add_argument(
+        "--safe",
+        action="store_true",
+        help="Confirma cada lote con write concern w=\"majority\" en lugar de una única confirmación al final"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=positive_int,
+        default=None,
+        help="Tamaño de mini-batch para la generación de embeddings (por defecto: 256 en GPU CUDA, 64 en CPU)"
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Compila el modelo con torch.compile (mayor tiempo de arranque, inferencia más rápida)"
+    )
+    parser.add_argument(
+        "--bettertransformer",
+        action="store_true",
+        help="Usa el backend BetterTransformer de optimum para el encoder (requiere 'pip install optimum')"
+    )
+    parser.add_argument(
+        "--int8-embeddings",
+        action="store_true",
+        help="Almacena los embeddings cuantizados a int8 (384 bytes por documento en lugar de 1536)"
+    )
+    parser.add_argument(
+        "--encode-processes",
+        type=non_negative_int,
+        default=0,
+        metavar="N",
+        help="Vectoriza con N procesos en paralelo (por defecto: 0, en el propio proceso)"
+    )
+    parser.add_argument(
+        "--deep-validate",
+        action="store_true",
+        help="Valida el tamaño de todos los embeddings recorriendo la colección completa"
+    )
+    return parser.parse_args()
+
+
 def main():
     """Función principal del script"""
+    args = parse_args()
+    
     print("\n" + "🌟"*30)
     print("LABORATORIO 2 - REQUISITO 2")
     print("Preprocesamiento y Vectorización del Corpus")
@@ -423,13 +1315,22 @@ def main():
         return 1
     
     try:
-        processor = CorpusProcessor(CORPUS_PATH)
+        write_concern = WriteConcern(w="majority", wtimeout=5000) if args.safe else None
+        processor = CorpusProcessor(
+            CORPUS_PATH,
+            write_concern=write_concern,
+            batch_size=args.batch_size,
+            compile_model=args.compile,
+            use_bettertransformer=args.bettertransformer,
+            int8_embeddings=args.int8_embeddings,
+            encode_processes=args.encode_processes
+        )
         
-        processor.process_corpus()
+        processor.migrate_legacy_embeddings()
         
-        processor.validate_collection()
+        processor.process_corpus()
         
-        processor.create_indexes()
+        processor.validate_collection(deep=args.deep_validate)
 
         processor.close()
         